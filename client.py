@@ -1,21 +1,45 @@
 import base64
+import gzip
 import json
 import os
 from pathlib import Path
+from typing import Optional
 
 import requests
 
 BASE = "http://127.0.0.1:8000"
 
-def send_pdf(path: str):
+def send_pdf(path: str, timeout: float = 20, compress: Optional[str] = "gzip"):
     p = Path(path)
     data = p.read_bytes()
     payload = {
         "filename": p.name,
         "data_base64": base64.b64encode(data).decode("ascii")
     }
-    r = requests.post(f"{BASE}/pdf/run", json=payload, timeout=20)
+    body = json.dumps(payload).encode("utf-8")
+
+    # Tell the server when we give up, so it stops parsing at the same time
+    headers = {"X-Request-Timeout": str(timeout), "Content-Type": "application/json"}
+
+    # Compress the upload, "zstd" needs the `zstandard` package, None to send as is
+    if compress == "gzip":
+        body = gzip.compress(body)
+        headers["Content-Encoding"] = "gzip"
+    elif compress == "zstd":
+        import zstandard
+
+        body = zstandard.ZstdCompressor().compress(body)
+        headers["Content-Encoding"] = "zstd"
+    elif compress is not None:
+        raise ValueError(f"Unsupported compression: {compress!r} (use 'gzip', 'zstd' or None)")
+
+    # requests asks for a compressed response and decompresses it
+    r = requests.post(f"{BASE}/pdf/run", data=body, headers=headers, timeout=timeout)
     r.raise_for_status()
+    print(
+        f"Bytes saved: request {r.headers.get('X-Request-Bytes-Saved', 0)}, "
+        f"response {r.headers.get('X-Response-Bytes-Saved', 0)}"
+    )
     print(r.json())
     return r.json()
 
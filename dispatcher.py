@@ -0,0 +1,266 @@
+import argparse
+import base64
+import json
+import os
+import subprocess
+import sys
+import threading
+from contextlib import asynccontextmanager
+
+import requests
+import urllib3
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from fastapi.responses import Response, StreamingResponse
+from starlette.background import BackgroundTask
+
+from utils import compression_utils, dispatch_utils
+
+# Comma separated base URLs of the `server.app` instances
+BACKEND_URLS = [
+    url for url in os.environ.get("PDF_PARSER_BACKENDS", "").split(",") if url
+]
+
+# Seconds between health checks of every backend
+HEALTH_INTERVAL = float(os.environ.get("PDF_DISPATCHER_HEALTH_INTERVAL", "2"))
+
+# A backend with a deeper queue than this only gets uploads when all others are as busy
+MAX_QUEUE_DEPTH = int(os.environ.get("PDF_DISPATCHER_MAX_QUEUE_DEPTH", "4"))
+
+# Forwarded to the backend, so it parses under the same deadline as the client
+FORWARD_HEADERS = ["content-type", "x-request-timeout"]
+
+backends = {}
+ring = dispatch_utils.HashRing([])
+
+
+def configure(backend_urls):
+    global backends, ring
+    backends = dict(
+        (b.url, b) for b in [dispatch_utils.Backend(url) for url in backend_urls]
+    )
+    ring = dispatch_utils.HashRing(list(backends.keys()))
+
+
+def check_health(backend):
+    try:
+        r = requests.get(f"{backend.url}/health", timeout=1)
+        r.raise_for_status()
+        backend.reported_in_flight = r.json().get("in_flight", 0)
+        backend.healthy = True
+    except (requests.RequestException, ValueError):
+        backend.healthy = False
+
+
+def health_loop(stop_event):
+    while not stop_event.is_set():
+        for backend in list(backends.values()):
+            check_health(backend)
+        stop_event.wait(HEALTH_INTERVAL)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    stop_event = threading.Event()
+    threading.Thread(target=health_loop, args=(stop_event,), daemon=True).start()
+    yield
+    stop_event.set()
+
+
+configure(BACKEND_URLS)
+app = FastAPI(title="Booking Confirmation PDF Parser Dispatcher", lifespan=lifespan)
+
+# Max decompressed size of a gzip/zstd request body (zip bomb guard)
+MAX_BODY_SIZE = int(os.environ.get("PDF_PARSER_MAX_BODY_SIZE", str(50 * 1024 * 1024)))
+
+# Bodies are decompressed here and forwarded plain, responses re-compressed for the client
+app.add_middleware(compression_utils.CompressionMiddleware, max_body_size=MAX_BODY_SIZE)
+
+
+def _decode_routing_key(body: bytes) -> bytes:
+    # Route by the PDF bytes, so the same document always lands on the same node
+    try:
+        return base64.b64decode(json.loads(body)["data_base64"], validate=True)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid payload")
+
+
+async def _routing_key(request: Request) -> bytes:
+    # Decoding a large upload would block every other request on the event loop
+    body = await request.body()
+    return await run_in_threadpool(_decode_routing_key, body)
+
+
+def _never_connected(error):
+    # Connection refused or timed out, the upload never reached the backend
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+
+def _forward(path, body, headers, data, stream=False):
+    """
+    Send the upload to the first backend that answers, in
+    `choose_backends` order, marking dead backends as unhealthy.
+
+    Returns:
+        tuple: (Backend, requests.Response), the backend is still acquired.
+    """
+    candidates = dispatch_utils.choose_backends(
+        ring, backends, data, max_queue_depth=MAX_QUEUE_DEPTH
+    )
+
+    for backend in candidates:
+        backend.acquire()
+        try:
+            r = requests.post(
+                f"{backend.url}{path}",
+                data=body,
+                headers=headers,
+                timeout=(1, None),
+                stream=stream,
+            )
+        except requests.ConnectionError as e:
+            backend.release()
+            if not _never_connected(e):
+                # Node died after the upload was sent, it may have been parsed already
+                raise HTTPException(
+                    status_code=502, detail=f"Parser backend {backend.url} failed: {e}"
+                )
+            # Node is down, re-route to the next one on the ring
+            backend.healthy = False
+            print(f"Backend {backend.url} unreachable, re-routing.")
+            continue
+        except requests.RequestException as e:
+            # Failed after the upload was sent, do not retry
+            backend.release()
+            raise HTTPException(
+                status_code=502, detail=f"Parser backend {backend.url} failed: {e}"
+            )
+        except BaseException:
+            backend.release()
+            raise
+        return backend, r
+
+    raise HTTPException(status_code=503, detail="No parser backend available")
+
+
+def _forward_headers(request: Request):
+    return dict(
+        (k, v) for k, v in request.headers.items() if k.lower() in FORWARD_HEADERS
+    )
+
+
+@app.post("/pdf/run")
+async def pdf_size(request: Request):
+    data = await _routing_key(request)
+    body = await request.body()
+
+    backend, r = await run_in_threadpool(
+        _forward, "/pdf/run", body, _forward_headers(request), data
+    )
+    try:
+        return Response(
+            content=r.content,
+            status_code=r.status_code,
+            media_type=r.headers.get("content-type"),
+            headers={"X-Parser-Backend": backend.url},
+        )
+    finally:
+        r.close()
+        backend.release()
+
+
+@app.post("/pdf/stream")
+async def pdf_stream(request: Request):
+    data = await _routing_key(request)
+    body = await request.body()
+
+    backend, r = await run_in_threadpool(
+        _forward, "/pdf/stream", body, _forward_headers(request), data, True
+    )
+
+    released = False
+
+    def cleanup():
+        # Called from the relay and as background task, whichever runs first
+        nonlocal released
+        if not released:
+            released = True
+            r.close()
+            backend.release()
+
+    async def relay():
+        try:
+            async for chunk in iterate_in_threadpool(r.iter_content(chunk_size=None)):
+                yield chunk
+        finally:
+            cleanup()
+
+    try:
+        return StreamingResponse(
+            relay(),
+            status_code=r.status_code,
+            media_type=r.headers.get("content-type"),
+            headers={"X-Parser-Backend": backend.url},
+            # Runs when the response is done, also if the body was never iterated
+            background=BackgroundTask(cleanup),
+        )
+    except BaseException:
+        cleanup()
+        raise
+
+
+@app.get("/health")
+def health():
+    return {
+        "status": "ok" if any(b.healthy for b in backends.values()) else "degraded",
+        "backends": [b.to_dict() for b in backends.values()],
+    }
+
+
+def spawn_backends(count, first_port):
+    # Start `count` local `server.app` instances on consecutive ports
+    processes = []
+    for port in range(first_port, first_port + count):
+        processes.append(
+            subprocess.Popen(
+                [sys.executable, "-m", "uvicorn", "server:app", "--port", str(port)]
+            )
+        )
+    return processes, [f"http://127.0.0.1:{p}" for p in range(first_port, first_port + count)]
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Dispatch uploads to parser instances.")
+    parser.add_argument("--port", type=int, default=8000, help="Dispatcher port")
+    parser.add_argument(
+        "--backends",
+        default=",".join(BACKEND_URLS),
+        help="Comma separated backend URLs (default: $PDF_PARSER_BACKENDS)",
+    )
+    parser.add_argument(
+        "--spawn", type=int, default=0, help="Start N local server.app instances"
+    )
+    parser.add_argument(
+        "--backend-port", type=int, default=8001, help="First port for --spawn"
+    )
+    args = parser.parse_args()
+
+    processes = []
+    backend_urls = [url for url in args.backends.split(",") if url]
+    if args.spawn > 0:
+        processes, spawned_urls = spawn_backends(args.spawn, args.backend_port)
+        backend_urls += spawned_urls
+
+    configure(backend_urls)
+    print(f"Dispatching to {len(backends)} backend(s): {list(backends.keys())}")
+
+    try:
+        uvicorn.run(app, port=args.port)
+    finally:
+        for p in processes:
+            p.terminate()
@@ -6,20 +6,65 @@ from pathlib import Path
 
 import pdfplumber
 
-from utils import key_utils, pdf_utils
+from utils import key_utils, pdf_utils, snapshot_utils
 
 
 def main(args):
+    if args.relabel:
+        relabel(args)
+        return
+
     if not os.path.exists(args.filename):
         print("File path does not exist")
         return
 
-    # Read PDF
-    pdf = pdfplumber.open(args.filename)
+    page_words = None
+    if args.snapshot_dir:
+        path = snapshot_utils.snapshot_path(
+            args.snapshot_dir, snapshot_utils.pdf_hash(Path(args.filename).read_bytes())
+        )
+        if os.path.exists(path):
+            print(f"Reading words from snapshot: {path}")
+            try:
+                page_words, _ = snapshot_utils.load_page_words(path)
+            except Exception as e:
+                # Broken snapshot, extract again (and overwrite it below)
+                print(f"Unreadable snapshot, extracting again: {e}")
+
+    if page_words is None:
+        # Read PDF
+        pdf = pdfplumber.open(args.filename)
+
+        # Use pdfplumber to extract the word in every pages
+        page_words = [page.extract_words(use_text_flow=True) for page in pdf.pages]
+
+        if args.snapshot_dir:
+            snapshot_utils.save_page_words(
+                path, page_words, source=Path(args.filename).name
+            )
+            print(f"Write word snapshot to: {path}")
+
+    parse_page_words(page_words, args.filename, args)
+
+
+def relabel(args):
+    # Re-run every stored snapshot, without opening any PDF
+    if not args.snapshot_dir or not os.path.isdir(args.snapshot_dir):
+        print("Snapshot directory does not exist")
+        return
+
+    for snapshot_file in sorted(Path(args.snapshot_dir).glob("*.npz")):
+        try:
+            page_words, source = snapshot_utils.load_page_words(str(snapshot_file))
+        except Exception as e:
+            # One broken snapshot should not stop the others
+            print(f"Skipping unreadable snapshot {snapshot_file}: {e}")
+            continue
+        print(f"Relabel {source or snapshot_file.stem} from snapshot: {snapshot_file}")
+        parse_page_words(page_words, source or snapshot_file.name, args)
 
-    # Use pdfplumber to extract the word in every pages
-    page_words = [page.extract_words(use_text_flow=True) for page in pdf.pages]
 
+def parse_page_words(page_words, filename, args):
     print(f"Reading PDF with {len(page_words)} page(s).")
 
     # Find common header and footer
@@ -124,7 +169,7 @@ def main(args):
 
     if args.write_json:
         # make new filename with .json extension
-        file_path = Path(args.filename)
+        file_path = Path(filename)
         output_filename = os.path.join(
             "output", file_path.stem + ".json"
         )  # "BookingConfirm-SE.json"
@@ -145,6 +190,15 @@ if __name__ == "__main__":
         default="pdfs/BookingConfirm-SE.pdf",
     )
     parser.add_argument("--write-json", action="store_true", help="Write JSON output")
+    parser.add_argument(
+        "--snapshot-dir",
+        help="Store extracted words here (keyed by PDF hash) and re-use them on later runs",
+    )
+    parser.add_argument(
+        "--relabel",
+        action="store_true",
+        help="Re-run every snapshot in --snapshot-dir without extracting the PDFs",
+    )
     args = parser.parse_args()
 
     main(args=args)
@@ -1,4 +1,5 @@
 import argparse
+import asyncio
 import base64
 import io
 import json
@@ -7,13 +8,36 @@ import re
 from pathlib import Path
 
 import pdfplumber
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import iterate_in_threadpool, run_in_threadpool
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel, Field
 
-from utils import key_utils, pdf_utils
+from utils import compression_utils, deadline_utils, key_utils, pdf_utils, snapshot_utils
 
 app = FastAPI(title="Booking Confirmation PDF Parser API")
 
+# Max decompressed size of a gzip/zstd request body (zip bomb guard)
+MAX_BODY_SIZE = int(os.environ.get("PDF_PARSER_MAX_BODY_SIZE", str(50 * 1024 * 1024)))
+
+app.add_middleware(compression_utils.CompressionMiddleware, max_body_size=MAX_BODY_SIZE)
+
+# Per-request time budget in seconds, clients may lower it with TIMEOUT_HEADER
+DEFAULT_TIMEOUT = float(os.environ.get("PDF_PARSER_TIMEOUT", "20"))
+TIMEOUT_HEADER = "X-Request-Timeout"
+
+# Longest deadline a client may ask for, protects the CPU of queued requests
+MAX_TIMEOUT = float(os.environ.get("PDF_PARSER_MAX_TIMEOUT", str(DEFAULT_TIMEOUT)))
+
+# How often to poll for a client disconnect while parsing (seconds)
+DISCONNECT_POLL_INTERVAL = 0.5
+
+# Directory of extracted word snapshots, re-used instead of re-running pdfplumber
+SNAPSHOT_DIR = os.environ.get("PDF_PARSER_SNAPSHOT_DIR")
+
+# Parse requests currently being processed, reported by /health for the dispatcher
+in_flight = 0
+
 class PDFPayload(BaseModel):
     filename: str = Field(..., description="Original filename (for logging)")
     data_base64: str = Field(..., description="Base64-encoded PDF bytes")
@@ -23,28 +47,171 @@ def _is_pdf(data: bytes) -> bool:
     return data.startswith(b"%PDF-")
 
 
-def run(pdf_raw):
+def _resolve_timeout(request: Request) -> float:
+    # Take the deadline from the request header, fallback to server default
+    value = request.headers.get(TIMEOUT_HEADER)
+    if value is None:
+        return DEFAULT_TIMEOUT
+
+    try:
+        timeout = float(value)
+    except ValueError:
+        timeout = 0.0
+
+    if not timeout > 0:
+        raise HTTPException(
+            status_code=400, detail=f"{TIMEOUT_HEADER} must be a positive number of seconds"
+        )
+    return min(timeout, MAX_TIMEOUT)
+
+
+async def _watch_disconnect(request: Request, deadline: deadline_utils.Deadline):
+    # Cancel the pipeline as soon as the client goes away
+    while not deadline.expired():
+        if await request.is_disconnected():
+            deadline.cancel()
+            return
+        await asyncio.sleep(DISCONNECT_POLL_INTERVAL)
+
+
+def _iter_page_words(pdf_raw, deadline, source=""):
+    # Load the words from the snapshot if the document was extracted before
+    if SNAPSHOT_DIR:
+        path = snapshot_utils.snapshot_path(
+            SNAPSHOT_DIR, snapshot_utils.pdf_hash(pdf_raw)
+        )
+        if os.path.exists(path):
+            try:
+                page_words, _ = snapshot_utils.load_page_words(path)
+            except Exception as e:
+                # Broken snapshot, treat as a cache miss and extract again
+                print(f"Removing unreadable snapshot {path}: {e}")
+                _remove_snapshot(path)
+            else:
+                yield from page_words
+                return
+
     # Open with pdfplumber (use BytesIO wrapper)
     pdf = pdfplumber.open(io.BytesIO(pdf_raw))
 
     # Use pdfplumber to extract the word in every pages
-    page_words = [page.extract_words(use_text_flow=True) for page in pdf.pages]
+    page_words = []
+    for page in pdf.pages:
+        deadline.check("extract_words")
+        words = page.extract_words(use_text_flow=True)
+        page_words.append(words)
+        yield words
+
+    # Only complete documents are stored, a failed save only costs the cache
+    if SNAPSHOT_DIR:
+        try:
+            snapshot_utils.save_page_words(path, page_words, source=source)
+        except Exception as e:
+            print(f"Could not write snapshot {path}: {e}")
+
+
+def _remove_snapshot(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _load_key_maps():
+    # Translate
+    # create key map from json file, once per request
+    key_map, all_keys, all_keys_variance = key_utils.create_key_map(
+        "label.json", key_type="normal"
+    )
+    table_key_map, all_table_keys, all_table_keys_variance = key_utils.create_key_map(
+        "label.json", key_type="table"
+    )
+    return {
+        "key_map": key_map,
+        "all_keys": all_keys,
+        "all_keys_variance": all_keys_variance,
+        "table_key_map": table_key_map,
+        "all_table_keys_variance": all_table_keys_variance,
+    }
+
+
+def _init_output(key_maps):
+    # Init normal_dict (all keys with value = empty list)
+    normal_dict = dict([(k, []) for k in key_maps["all_keys"]])
 
-    print(f"Reading PDF with {len(page_words)} page(s).")
+    # Init output_dict, filled in place so a stopped pipeline still returns what it found
+    return dict([("normal", normal_dict), ("table", []), ("partial", False)])
 
+
+def _collect_event(output_dict, event):
+    # Add one event from `_parse_content` to the output_dict
+    if event["event"] == "normal":
+        output_dict["normal"][event["key"]].append(event["value"])
+    elif event["event"] == "table":
+        output_dict["table"].append(
+            {"header": event["header"], "content": event["content"]}
+        )
+
+
+def _strip_header_footer(page_words):
     # Find common header and footer
     header_word_count = pdf_utils.count_common_header(page_words)
     footer_word_count = pdf_utils.count_common_footer(page_words)
 
     # Remove Header and footer, only content
-    page_words_content = [
+    return [
         page[header_word_count : len(page) - footer_word_count] for page in page_words
     ]
 
+
+def _match_sentence(text, key_maps):
+    # Split each line based on the keys, returns the (key, value) pairs found
+    all_keys_variance = key_maps["all_keys_variance"]
+    tab_split_data = key_utils.tab_split(text, all_keys_variance)
+
+    key_values = []
+    for t in tab_split_data:
+        key_variance, value = key_utils.key_split(t, all_keys_variance)
+
+        if key_variance is not None and len(value) > 0:
+            key_values.append((key_maps["key_map"][key_variance], value))
+    return key_values
+
+
+def _match_table_header(text, key_maps):
+    return key_utils.match_key(
+        text,
+        key_list=key_maps["all_table_keys_variance"],
+        matching_threhold=90,
+    )[0]
+
+
+def _parse_content(page_words_content, key_maps, deadline, match_cache=None):
+    """
+    Merge and translate content words (header and footer already removed),
+    yielding each `normal` key/value and each table as soon as it is matched.
+
+    Args:
+        page_words_content: Pages of words, header and footer removed.
+        key_maps: Output of `_load_key_maps`.
+        deadline: Checked between stages, sentences and tables.
+        match_cache: Fuzzy matching results by text, shared between calls
+            so text that was matched before is not matched again.
+
+    Yields:
+        dict: {"event": "normal", "key", "value"} or {"event": "table", "header", "content"}
+    """
+    if match_cache is None:
+        match_cache = dict()
+
+    if not any(page_words_content):
+        return
+
     # Commind all page content
     combined_content = pdf_utils.combine_content(page_words_content)
 
     # First merge: Merge by spacebar
+    deadline.check("merge")
     sentence_list_temp1 = pdf_utils.horizontal_merge(
         combined_content, space_tolerance_ratio=0.5, height_tolerance_ratio=0.75
     )
@@ -55,9 +222,11 @@ def run(pdf_raw):
     )
 
     # Table Merge
+    deadline.check("table_merge")
     sentence_list_table = pdf_utils.table_merge(sentence_list_temp2)
 
     # Third merge: Non-spacebar merge
+    deadline.check("merge")
     sentence_list_merged = pdf_utils.horizontal_merge(
         sentence_list_temp2,
         merging_string="|",
@@ -65,66 +234,210 @@ def run(pdf_raw):
         height_tolerance_ratio=0.75,
     )
 
-    # Translate
-    # create key map from json file
-    key_map, all_keys, all_keys_variance = key_utils.create_key_map(
-        "label.json", key_type="normal"
-    )
-    table_key_map, all_table_keys, all_table_keys_variance = key_utils.create_key_map(
-        "label.json", key_type="table"
-    )
-
-    # Init normal_dict (all keys with value = empty list)
-    normal_dict = dict([(k, []) for k in all_keys])
-
     for sentence in sentence_list_merged:
+        deadline.check("match_normal")
 
-        # Split each line based on the keys
-        tab_split_data = key_utils.tab_split(sentence["text"], all_keys_variance)
-
-        for t in tab_split_data:
-            key_variance, value = key_utils.key_split(t, all_keys_variance)
+        cache_key = ("normal", sentence["text"])
+        if cache_key not in match_cache:
+            match_cache[cache_key] = _match_sentence(sentence["text"], key_maps)
 
-            if key_variance is not None and len(value) > 0:
-                normal_dict[key_map[key_variance]].append(value)
+        for key, value in match_cache[cache_key]:
+            yield {"event": "normal", "key": key, "value": value}
 
-    all_table_list = []
     for tb in sentence_list_table:
+        deadline.check("match_table")
+
         if len(tb) <= 1:
             continue
 
         header_row = tb[0]
 
         # Check if all header is in desired key
-        header_matched_keys = [
-            key_utils.match_key(
-                header_col["text"],
-                key_list=all_table_keys_variance,
-                matching_threhold=90,
-            )[0]
-            for header_col in header_row
-        ]
+        header_matched_keys = []
+        for header_col in header_row:
+            cache_key = ("table", header_col["text"])
+            if cache_key not in match_cache:
+                match_cache[cache_key] = _match_table_header(header_col["text"], key_maps)
+            header_matched_keys.append(match_cache[cache_key])
 
         if any(h is None for h in header_matched_keys):
             # If any is not in table key, skip
             continue
-        header_keys = [table_key_map[hk] for hk in header_matched_keys]
+        header_keys = [key_maps["table_key_map"][hk] for hk in header_matched_keys]
 
         table_content_rows = tb[1:]
         table_content_texts = []
         for table_content_row in table_content_rows:
             table_content_texts.append([c["text"] for c in table_content_row])
 
-        table_dict = {"header": header_keys, "content": table_content_texts}
-        all_table_list.append(table_dict)
+        yield {"event": "table", "header": header_keys, "content": table_content_texts}
+
+
+def _mark_partial(output_dict, e):
+    print(f"Stopped parsing: {e}")
+    output_dict["partial"] = True
+    output_dict["stopped_at"] = e.stage
+    output_dict["cancelled"] = e.cancelled
+
+
+def run(pdf_raw, deadline=None, source=""):
+    if deadline is None:
+        deadline = deadline_utils.Deadline()
+
+    key_maps = _load_key_maps()
+    output_dict = _init_output(key_maps)
+
+    try:
+        page_words = list(_iter_page_words(pdf_raw, deadline, source))
+
+        print(f"Reading PDF with {len(page_words)} page(s).")
+
+        deadline.check("header_footer")
+        page_words_content = _strip_header_footer(page_words)
+
+        for event in _parse_content(page_words_content, key_maps, deadline):
+            _collect_event(output_dict, event)
+
+    except deadline_utils.DeadlineExceeded as e:
+        _mark_partial(output_dict, e)
 
-    # Init output_dict
-    output_dict = dict([("normal", normal_dict), ("table", all_table_list)])
     return output_dict
 
 
-@app.post("/pdf/run")
-def pdf_size(payload: PDFPayload):
+def _stream_pages(
+    page_words, parse_until, sent_pages, output_dict, key_maps, deadline, match_cache
+):
+    """
+    Parse pages `len(sent_pages)` to `parse_until` (exclusive) and yield
+    their events, with header and footer compared across the pages read
+    so far.
+
+    More pages can only shorten the common header and footer, so words
+    stripped from pages that were already sent may turn out to be content.
+    Those pages are parsed again and only the events not sent yet are
+    yielded (a sentence may continue into the uncovered words, so the
+    words are not parsed on their own).
+
+    Args:
+        sent_pages: (header, footer, events) of each page already sent,
+            updated in place.
+    """
+    header_word_count = pdf_utils.count_common_header(page_words)
+    footer_word_count = pdf_utils.count_common_footer(page_words)
+    counts = (header_word_count, footer_word_count)
+
+    def parse_page(page_index, sent_events):
+        page = page_words[page_index]
+        content = page[header_word_count : len(page) - footer_word_count]
+        unmatched = list(sent_events)
+        for event in _parse_content([content], key_maps, deadline, match_cache):
+            if event in unmatched:
+                unmatched.remove(event)
+                continue
+            sent_events.append(event)
+            _collect_event(output_dict, event)
+            yield {**event, "page": page_index + 1}
+
+    # Earlier pages with header or footer words that are content after all
+    for page_index, (*page_counts, sent_events) in enumerate(sent_pages):
+        if tuple(page_counts) != counts:
+            yield from parse_page(page_index, sent_events)
+            sent_pages[page_index] = (*counts, sent_events)
+
+    # New pages
+    for page_index in range(len(sent_pages), parse_until):
+        sent_events = []
+        sent_pages.append((*counts, sent_events))
+        yield from parse_page(page_index, sent_events)
+
+
+def _missing_events(summary_dict, output_dict):
+    # Summary results that no event has carried yet (e.g. tables crossing a page break)
+    for key, values in summary_dict["normal"].items():
+        sent_values = list(output_dict["normal"][key])
+        for value in values:
+            if value in sent_values:
+                sent_values.remove(value)
+            else:
+                yield {"event": "normal", "key": key, "value": value, "page": None}
+
+    sent_tables = list(output_dict["table"])
+    for table in summary_dict["table"]:
+        if table in sent_tables:
+            sent_tables.remove(table)
+        else:
+            yield {"event": "table", **table, "page": None}
+
+
+def stream_run(pdf_raw, deadline=None, source=""):
+    """
+    Page by page variant of `run`, yielding events as soon as they are found.
+
+    Each page is parsed on its own once the next page has been read
+    (header and footer detection needs a second page to compare with).
+    Pages whose header or footer words turn out to be content once later
+    pages are read are parsed again, and their missing events come late
+    instead of being lost. Events already sent are not taken back, so a
+    value cut by a wrong footer may be sent both cut and whole.
+
+    The final "summary" event is the same as the output of `run`. It
+    re-runs the merges over the whole document, but fuzzy matching
+    results of the pages are re-used, so only text that crosses a page
+    break is matched again. Summary results that no event carried
+    (sentences and tables crossing a page break) are sent as events
+    with "page": None just before the summary.
+
+    Args:
+        source: Original filename, stored with the word snapshot.
+
+    Yields:
+        dict: "normal" and "table" events (with "page"), then one "summary" event.
+    """
+    if deadline is None:
+        deadline = deadline_utils.Deadline()
+
+    key_maps = _load_key_maps()
+    match_cache = dict()
+
+    # Results of the events sent so far, used as summary if the deadline hits
+    output_dict = _init_output(key_maps)
+    page_words = []
+    sent_pages = []
+
+    try:
+        for words in _iter_page_words(pdf_raw, deadline, source):
+            page_words.append(words)
+
+            if len(page_words) >= 2:
+                yield from _stream_pages(
+                    page_words, len(page_words) - 1, sent_pages,
+                    output_dict, key_maps, deadline, match_cache,
+                )
+
+        yield from _stream_pages(
+            page_words, len(page_words), sent_pages,
+            output_dict, key_maps, deadline, match_cache,
+        )
+
+        print(f"Reading PDF with {len(page_words)} page(s).")
+
+        # Whole document pass, so results crossing page breaks are merged like `run`
+        deadline.check("header_footer")
+        summary_dict = _init_output(key_maps)
+        page_words_content = _strip_header_footer(page_words)
+        for event in _parse_content(page_words_content, key_maps, deadline, match_cache):
+            _collect_event(summary_dict, event)
+
+        yield from _missing_events(summary_dict, output_dict)
+        output_dict = summary_dict
+
+    except deadline_utils.DeadlineExceeded as e:
+        _mark_partial(output_dict, e)
+
+    yield {"event": "summary", "pages": len(page_words), **output_dict}
+
+
+def _decode_payload(payload: PDFPayload) -> bytes:
     # 1) decode
     try:
         raw = base64.b64decode(payload.data_base64, validate=True)
@@ -135,12 +448,75 @@ def pdf_size(payload: PDFPayload):
     if not _is_pdf(raw):
         raise HTTPException(status_code=400, detail="Decoded data is not a PDF (missing %PDF- header)")
 
+    return raw
+
+
+@app.post("/pdf/run")
+async def pdf_size(payload: PDFPayload, request: Request):
+    deadline = deadline_utils.Deadline(_resolve_timeout(request))
+
+    raw = _decode_payload(payload)
+
     # 3) Run
     size_bytes = len(raw)
     size_kb = round(size_bytes / 1024, 2)
     size_mb = round(size_bytes / (1024 * 1024), 2)
 
-    output  = run(pdf_raw=raw)
+    global in_flight
+    in_flight += 1
+
+    # Parse in the threadpool so the disconnect watcher keeps running
+    watcher = asyncio.create_task(_watch_disconnect(request, deadline))
+    try:
+        output = await run_in_threadpool(run, raw, deadline, payload.filename)
+    finally:
+        watcher.cancel()
+        in_flight -= 1
+
+    if output["partial"]:
+        if output["cancelled"]:
+            # Nobody is listening anymore (nginx-style "client closed request")
+            raise HTTPException(status_code=499, detail="Client disconnected")
+
+        if not any(output["normal"].values()) and len(output["table"]) == 0:
+            # Ran out of time before anything was matched
+            raise HTTPException(
+                status_code=504,
+                detail=f"Deadline exceeded before stage '{output['stopped_at']}'",
+            )
+
     output['format'] = payload.filename
 
-    return output
\ No newline at end of file
+    return output
+
+
+@app.post("/pdf/stream")
+async def pdf_stream(payload: PDFPayload, request: Request):
+    deadline = deadline_utils.Deadline(_resolve_timeout(request))
+    raw = _decode_payload(payload)
+
+    async def ndjson_events():
+        global in_flight
+        in_flight += 1
+
+        # The threadpool only returns between events, so the generator being
+        # closed is not enough to stop the parsing when the client goes away
+        watcher = asyncio.create_task(_watch_disconnect(request, deadline))
+        try:
+            # Each page is parsed in the threadpool, events are sent as they come
+            events = stream_run(raw, deadline, payload.filename)
+            async for event in iterate_in_threadpool(events):
+                if event["event"] == "summary":
+                    event["format"] = payload.filename
+                yield json.dumps(event, ensure_ascii=False) + "\n"
+        finally:
+            watcher.cancel()
+            deadline.cancel()
+            in_flight -= 1
+
+    return StreamingResponse(ndjson_events(), media_type="application/x-ndjson")
+
+
+@app.get("/health")
+def health():
+    return {"status": "ok", "in_flight": in_flight}
@@ -0,0 +1,94 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+def make_pdf(pages, font_size=10):
+    """
+    Build a minimal PDF with Helvetica text.
+
+    Args:
+        pages: One list per page of (x, y, text) tuples, y from the bottom.
+        font_size: Font size of every text.
+
+    Returns:
+        bytes: PDF file content.
+    """
+    page_count = len(pages)
+    # 1: catalog, 2: pages, 3: font, then a page and a content stream per page
+    page_ids = [4 + 2 * i for i in range(page_count)]
+
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        b"<< /Type /Pages /Kids [%s] /Count %d >>"
+        % (b" ".join(b"%d 0 R" % i for i in page_ids), page_count),
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    for page_id, texts in zip(page_ids, pages):
+        stream = b"".join(
+            b"BT /F1 %d Tf %d %d Td (%s) Tj ET\n"
+            % (
+                font_size,
+                x,
+                y,
+                text.replace("\\", "\\\\")
+                .replace("(", "\\(")
+                .replace(")", "\\)")
+                .encode("latin-1"),
+            )
+            for x, y, text in texts
+        )
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>"
+            % (page_id + 1)
+        )
+        objects.append(b"<< /Length %d >>\nstream\n%sendstream" % (len(stream), stream))
+
+    pdf = b"%PDF-1.4\n"
+    offsets = []
+    for i, obj in enumerate(objects):
+        offsets.append(len(pdf))
+        pdf += b"%d 0 obj\n%s\nendobj\n" % (i + 1, obj)
+
+    xref_offset = len(pdf)
+    pdf += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    pdf += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    pdf += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref_offset,
+    )
+    return pdf
+
+
+def booking_page(lines, header="ACME SHIPPING BOOKING CONFIRMATION"):
+    # Page with a common header and footer, and one "key value" line per item
+    texts = [(50, 800, header), (50, 30, "Footer company ltd")]
+    y = 760
+    for key, value in lines:
+        texts += [(50, y, key), (125, y, value)]
+        y -= 16
+    return texts
+
+
+@pytest.fixture
+def sample_pdf():
+    return make_pdf(
+        [
+            booking_page(
+                [("Booking No", "BK0123"), ("Vessel", "SEA STAR"), ("ETD", "12 OCT")]
+            ),
+            booking_page([("Destination", "TOKYO"), ("Date", "1 OCT")]),
+            booking_page([("Remark", "fragile")]),
+        ]
+    )
+
+
+@pytest.fixture(autouse=True)
+def repo_cwd(monkeypatch):
+    # server.py and main.py read "label.json" relative to the repo root
+    monkeypatch.chdir(ROOT)
@@ -0,0 +1,155 @@
+import gzip
+import zlib
+
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+from starlette.testclient import TestClient
+
+from utils import compression_utils
+
+MAX_BODY_SIZE = 1024 * 1024
+
+# zstd is only tested when the optional `zstandard` package is installed
+ENCODINGS = list(compression_utils.DECODERS)
+DECODE_ERRORS = (zlib.error,)
+if compression_utils.zstandard is not None:
+    DECODE_ERRORS += (compression_utils.zstandard.ZstdError,)
+
+requires_zstd = pytest.mark.skipif(
+    compression_utils.zstandard is None, reason="zstandard not installed"
+)
+
+
+def compress(encoding, data):
+    return compression_utils.compress(data, encoding)
+
+
+def decode(encoding, data, max_size=MAX_BODY_SIZE, step=None):
+    writer = compression_utils._LimitedWriter(max_size)
+    decoder = compression_utils.DECODERS[encoding](writer)
+    step = step or max(len(data), 1)
+    for i in range(0, len(data), step):
+        decoder.write(data[i : i + step])
+    decoder.finish()
+    return bytes(writer.buffer)
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+@pytest.mark.parametrize("step", [None, 1, 7])
+def test_decoder_roundtrip_across_chunks(encoding, step):
+    data = b"booking confirmation " * 5000
+    assert decode(encoding, compress(encoding, data), step=step) == data
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_decoder_reads_concatenated_members(encoding):
+    body = compress(encoding, b"abc") + compress(encoding, b"def")
+    assert decode(encoding, body) == b"abcdef"
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+@pytest.mark.parametrize(
+    "make_body",
+    [
+        lambda encoding: compress(encoding, b"x" * 100000)[:-6],  # truncated
+        lambda encoding: b"",  # empty
+        lambda encoding: compress(encoding, b"abc") + b"junk",  # trailing garbage
+    ],
+)
+def test_decoder_rejects_invalid_body(encoding, make_body):
+    with pytest.raises(DECODE_ERRORS):
+        decode(encoding, make_body(encoding))
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_decoder_stops_zip_bomb_early(encoding):
+    bomb = compress(encoding, b"\0" * (50 * MAX_BODY_SIZE))
+
+    writer = compression_utils._LimitedWriter(MAX_BODY_SIZE)
+    decoder = compression_utils.DECODERS[encoding](writer)
+    with pytest.raises(compression_utils.BodyTooLarge):
+        decoder.write(bomb)
+    assert len(writer.buffer) <= MAX_BODY_SIZE
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected",
+    [
+        ("gzip, deflate", "gzip"),
+        ("zstd;q=0, gzip", "gzip"),
+        ("gzip;q=0", None),
+        ("br", None),
+        ("", None),
+        pytest.param("gzip, zstd", "zstd", marks=requires_zstd),
+        pytest.param("*", "zstd", marks=requires_zstd),
+    ],
+)
+def test_choose_encoding(accept_encoding, expected):
+    assert compression_utils.choose_encoding(accept_encoding) == expected
+
+
+async def echo(request):
+    body = await request.body()
+    return JSONResponse({"size": len(body), "text": body.decode("utf-8") * 1000})
+
+
+async def stream(request):
+    async def chunks():
+        for i in range(3):
+            yield f"line {i}\n".encode("utf-8")
+
+    return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+
+@pytest.fixture
+def client():
+    app = Starlette(routes=[Route("/echo", echo, methods=["POST"]), Route("/stream", stream)])
+    app.add_middleware(
+        compression_utils.CompressionMiddleware, max_body_size=MAX_BODY_SIZE
+    )
+    return TestClient(app)
+
+
+@pytest.mark.parametrize("encoding", ENCODINGS)
+def test_middleware_decompresses_request(client, encoding):
+    body = compress(encoding, b"a" * 5000)
+    r = client.post("/echo", content=body, headers={"Content-Encoding": encoding})
+
+    assert r.status_code == 200
+    assert r.json()["size"] == 5000
+    assert int(r.headers["x-request-bytes-saved"]) == 5000 - len(body)
+
+
+def test_middleware_rejects_zip_bomb(client):
+    body = gzip.compress(b"\0" * (MAX_BODY_SIZE + 1))
+    r = client.post("/echo", content=body, headers={"Content-Encoding": "gzip"})
+    assert r.status_code == 413
+
+
+def test_middleware_rejects_invalid_body(client):
+    body = gzip.compress(b"a" * 5000)[:-4]
+    r = client.post("/echo", content=body, headers={"Content-Encoding": "gzip"})
+    assert r.status_code == 400
+
+
+def test_middleware_rejects_unknown_encoding(client):
+    r = client.post("/echo", content=b"abc", headers={"Content-Encoding": "br"})
+    assert r.status_code == 415
+
+
+def test_middleware_compresses_response(client):
+    r = client.post("/echo", content=b"abc", headers={"Accept-Encoding": "gzip"})
+
+    assert r.headers["content-encoding"] == "gzip"
+    assert r.json()["text"] == "abc" * 1000
+    assert int(r.headers["x-response-bytes-saved"]) > 0
+
+
+def test_middleware_compresses_stream(client):
+    r = client.get("/stream", headers={"Accept-Encoding": "gzip"})
+
+    assert r.headers["content-encoding"] == "gzip"
+    assert "content-length" not in r.headers
+    assert r.text == "line 0\nline 1\nline 2\n"
@@ -0,0 +1,38 @@
+import time
+
+import pytest
+
+from utils import deadline_utils
+
+
+def test_no_deadline_never_expires():
+    deadline = deadline_utils.Deadline()
+
+    assert deadline.remaining() is None
+    assert not deadline.expired()
+    deadline.check("merge")
+
+
+def test_deadline_expires():
+    deadline = deadline_utils.Deadline(0.01)
+    assert 0 < deadline.remaining() <= 0.01
+
+    time.sleep(0.02)
+
+    assert deadline.remaining() == 0.0
+    assert deadline.expired()
+    with pytest.raises(deadline_utils.DeadlineExceeded) as e:
+        deadline.check("match_normal")
+    assert e.value.stage == "match_normal"
+    assert not e.value.cancelled
+
+
+def test_cancel():
+    deadline = deadline_utils.Deadline(60)
+    deadline.cancel()
+
+    assert deadline.cancelled
+    assert deadline.expired()
+    with pytest.raises(deadline_utils.DeadlineExceeded) as e:
+        deadline.check("extract_words")
+    assert e.value.cancelled
@@ -0,0 +1,98 @@
+from utils import dispatch_utils
+
+URLS = ["http://127.0.0.1:8001", "http://127.0.0.1:8002", "http://127.0.0.1:8003"]
+KEYS = [f"booking-{i}".encode("utf-8") for i in range(1000)]
+
+
+def make_backends(urls=URLS):
+    return dict((url, dispatch_utils.Backend(url)) for url in urls)
+
+
+def test_ring_order_is_stable_and_complete():
+    ring = dispatch_utils.HashRing(URLS)
+    other_ring = dispatch_utils.HashRing(list(reversed(URLS)))
+
+    for key in KEYS[:50]:
+        order = ring.nodes_for(key)
+        assert sorted(order) == sorted(URLS)
+        assert order == ring.nodes_for(key)
+        assert order == other_ring.nodes_for(key)
+
+
+def test_ring_spreads_keys():
+    ring = dispatch_utils.HashRing(URLS)
+    owners = [ring.nodes_for(key)[0] for key in KEYS]
+
+    for url in URLS:
+        assert owners.count(url) > len(KEYS) / len(URLS) / 2
+
+
+def test_removing_node_only_moves_its_keys():
+    ring = dispatch_utils.HashRing(URLS)
+    smaller_ring = dispatch_utils.HashRing(URLS[:2])
+
+    for key in KEYS:
+        owner = ring.nodes_for(key)[0]
+        if owner != URLS[2]:
+            assert smaller_ring.nodes_for(key)[0] == owner
+
+
+def test_empty_ring():
+    assert dispatch_utils.HashRing([]).nodes_for(b"x") == []
+
+
+def test_choose_backends_prefers_ring_owner():
+    ring = dispatch_utils.HashRing(URLS)
+    backends = make_backends()
+
+    order = [b.url for b in dispatch_utils.choose_backends(ring, backends, b"pdf")]
+    assert order == ring.nodes_for(b"pdf")
+
+
+def test_choose_backends_skips_unhealthy_owner():
+    ring = dispatch_utils.HashRing(URLS)
+    backends = make_backends()
+    ring_order = ring.nodes_for(b"pdf")
+    backends[ring_order[0]].healthy = False
+
+    order = [b.url for b in dispatch_utils.choose_backends(ring, backends, b"pdf")]
+    assert order == ring_order[1:] + ring_order[:1]
+
+
+def test_choose_backends_skips_owner_deeper_than_max_queue_depth():
+    ring = dispatch_utils.HashRing(URLS)
+    backends = make_backends()
+    ring_order = ring.nodes_for(b"pdf")
+
+    # At the limit is still fine
+    backends[ring_order[0]].reported_in_flight = 4
+    order = dispatch_utils.choose_backends(ring, backends, b"pdf", max_queue_depth=4)
+    assert order[0].url == ring_order[0]
+
+    # Deeper than the limit goes last among healthy nodes
+    backends[ring_order[0]].reported_in_flight = 5
+    order = dispatch_utils.choose_backends(ring, backends, b"pdf", max_queue_depth=4)
+    assert [b.url for b in order] == ring_order[1:] + ring_order[:1]
+
+
+def test_choose_backends_overloaded_sorted_by_depth():
+    ring = dispatch_utils.HashRing(URLS)
+    backends = make_backends()
+    ring_order = ring.nodes_for(b"pdf")
+    for depth, url in zip([9, 7, 8], ring_order):
+        backends[url].in_flight = depth
+
+    order = dispatch_utils.choose_backends(ring, backends, b"pdf", max_queue_depth=4)
+    assert [b.queue_depth for b in order] == [7, 8, 9]
+
+
+def test_backend_acquire_release():
+    backend = dispatch_utils.Backend("http://127.0.0.1:8001/")
+
+    backend.acquire()
+    backend.acquire()
+    backend.release()
+
+    assert backend.url == "http://127.0.0.1:8001"
+    assert backend.in_flight == 1
+    assert backend.queue_depth == 1
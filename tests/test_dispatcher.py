@@ -0,0 +1,110 @@
+import pytest
+import requests
+import urllib3
+from fastapi import HTTPException
+from starlette.testclient import TestClient
+
+import dispatcher
+
+URLS = ["http://127.0.0.1:8001", "http://127.0.0.1:8002", "http://127.0.0.1:8003"]
+KEY = b"pdf"
+
+
+def refused():
+    reason = urllib3.exceptions.NewConnectionError(None, "Connection refused")
+    return requests.ConnectionError(urllib3.exceptions.MaxRetryError(None, "/", reason))
+
+
+def reset():
+    return requests.ConnectionError(
+        urllib3.exceptions.ProtocolError("Connection aborted.", ConnectionResetError())
+    )
+
+
+class FakeResponse:
+    status_code = 200
+    content = b'{"partial": false}'
+    headers = {"content-type": "application/json"}
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def posts(monkeypatch):
+    """
+    Stub `requests.post`, failing with `errors[url]` for the given backends.
+
+    Returns:
+        tuple: (errors, calls), errors to fill in and the URLs posted to.
+    """
+    dispatcher.configure(URLS)
+    errors = dict()
+    calls = []
+
+    def post(url, **kwargs):
+        backend_url = url.rsplit("/pdf/", 1)[0]
+        calls.append(backend_url)
+        if backend_url in errors:
+            raise errors[backend_url]
+        return FakeResponse()
+
+    monkeypatch.setattr(dispatcher.requests, "post", post)
+    return errors, calls
+
+
+def ring_order():
+    return dispatcher.ring.nodes_for(KEY)
+
+
+@pytest.mark.parametrize("make_error", [refused, requests.ConnectTimeout])
+def test_forward_reroutes_when_never_connected(posts, make_error):
+    errors, calls = posts
+    owner, next_node = ring_order()[:2]
+    errors[owner] = make_error()
+
+    backend, r = dispatcher._forward("/pdf/run", b"{}", {}, KEY)
+
+    assert backend.url == next_node
+    assert calls == [owner, next_node]
+    assert not dispatcher.backends[owner].healthy
+    assert dispatcher.backends[owner].in_flight == 0
+    assert backend.in_flight == 1
+
+
+def test_forward_502_when_backend_fails_mid_request(posts):
+    errors, calls = posts
+    owner = ring_order()[0]
+    errors[owner] = reset()
+
+    with pytest.raises(HTTPException) as e:
+        dispatcher._forward("/pdf/run", b"{}", {}, KEY)
+
+    assert e.value.status_code == 502
+    assert calls == [owner]
+    assert dispatcher.backends[owner].healthy
+    assert dispatcher.backends[owner].in_flight == 0
+
+
+def test_forward_503_when_no_backend_reachable(posts):
+    errors, calls = posts
+    for url in URLS:
+        errors[url] = refused()
+
+    with pytest.raises(HTTPException) as e:
+        dispatcher._forward("/pdf/run", b"{}", {}, KEY)
+
+    assert e.value.status_code == 503
+    assert sorted(calls) == sorted(URLS)
+    assert all(b.in_flight == 0 for b in dispatcher.backends.values())
+
+
+def test_run_relays_response_and_releases_backend(posts):
+    client = TestClient(dispatcher.app)
+
+    r = client.post("/pdf/run", json={"filename": "a.pdf", "data_base64": "cGRm"})
+
+    assert r.status_code == 200
+    assert r.json() == {"partial": False}
+    assert r.headers["x-parser-backend"] == ring_order()[0]
+    assert all(b.in_flight == 0 for b in dispatcher.backends.values())
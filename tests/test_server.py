@@ -0,0 +1,169 @@
+import base64
+import json
+
+import pytest
+from starlette.requests import Request
+from starlette.testclient import TestClient
+
+import server
+from utils import deadline_utils, snapshot_utils
+
+from conftest import booking_page, make_pdf
+
+
+@pytest.fixture
+def client():
+    return TestClient(server.app)
+
+
+def payload(pdf):
+    return {"filename": "sample.pdf", "data_base64": base64.b64encode(pdf).decode("ascii")}
+
+
+def expire_at(monkeypatch, stage, after=0):
+    # Let the deadline pass at the `after`-th check of `stage`
+    calls = {"count": 0}
+    original_check = deadline_utils.Deadline.check
+
+    def check(self, checked_stage):
+        if checked_stage == stage:
+            calls["count"] += 1
+            if calls["count"] > after:
+                raise deadline_utils.DeadlineExceeded(checked_stage)
+        original_check(self, checked_stage)
+
+    monkeypatch.setattr(deadline_utils.Deadline, "check", check)
+
+
+def timeout_request(value):
+    return Request({"type": "http", "headers": [(b"x-request-timeout", value.encode())]})
+
+
+def test_run_complete(client, sample_pdf):
+    r = client.post("/pdf/run", json=payload(sample_pdf))
+
+    assert r.status_code == 200
+    assert r.json()["partial"] is False
+    assert r.json()["normal"]["BOOKING_NO"] == ["BK0123"]
+    assert r.json()["format"] == "sample.pdf"
+
+
+@pytest.mark.parametrize("value", ["abc", "0", "-1", "nan"])
+def test_run_rejects_bad_timeout_header(client, sample_pdf, value):
+    r = client.post(
+        "/pdf/run", json=payload(sample_pdf), headers={"X-Request-Timeout": value}
+    )
+    assert r.status_code == 400
+
+
+def test_timeout_header_is_capped(monkeypatch):
+    monkeypatch.setattr(server, "MAX_TIMEOUT", 30.0)
+
+    assert server._resolve_timeout(timeout_request("5")) == 5.0
+    assert server._resolve_timeout(timeout_request("1e9")) == 30.0
+    assert server._resolve_timeout(timeout_request("inf")) == 30.0
+    assert server._resolve_timeout(Request({"type": "http", "headers": []})) == (
+        server.DEFAULT_TIMEOUT
+    )
+
+
+def test_run_504_before_anything_matched(client, sample_pdf, monkeypatch):
+    expire_at(monkeypatch, "merge")
+
+    r = client.post("/pdf/run", json=payload(sample_pdf))
+
+    assert r.status_code == 504
+    assert "merge" in r.json()["detail"]
+
+
+def test_run_partial_after_some_matches(client, sample_pdf, monkeypatch):
+    expire_at(monkeypatch, "match_normal", after=3)
+
+    r = client.post("/pdf/run", json=payload(sample_pdf))
+
+    assert r.status_code == 200
+    output = r.json()
+    assert output["partial"] is True
+    assert output["stopped_at"] == "match_normal"
+    assert output["normal"]["BOOKING_NO"] == ["BK0123"]
+    assert output["normal"]["REMARK"] == []
+
+
+@pytest.mark.parametrize("path", ["/pdf/run", "/pdf/stream"])
+def test_snapshot_keeps_filename(client, sample_pdf, tmp_path, monkeypatch, path):
+    monkeypatch.setattr(server, "SNAPSHOT_DIR", str(tmp_path))
+
+    assert client.post(path, json=payload(sample_pdf)).status_code == 200
+
+    snapshot = snapshot_utils.snapshot_path(
+        str(tmp_path), snapshot_utils.pdf_hash(sample_pdf)
+    )
+    page_words, source = snapshot_utils.load_page_words(snapshot)
+    assert len(page_words) == 3
+    assert source == "sample.pdf"
+
+
+def stream_events(client, pdf):
+    r = client.post("/pdf/stream", json=payload(pdf))
+    assert r.status_code == 200
+    return [json.loads(line) for line in r.text.splitlines()]
+
+
+def assert_events_cover_summary(events, pdf):
+    *page_events, summary = events
+    assert summary["event"] == "summary"
+
+    # Every summary result was sent as an event (events may also hold values
+    # that were cut by a wrong header or footer before later pages were read)
+    for key, values in summary["normal"].items():
+        sent = [
+            e["value"]
+            for e in page_events
+            if e["event"] == "normal" and e["key"] == key
+        ]
+        for value in values:
+            assert value in sent
+            sent.remove(value)
+
+    sent_tables = [
+        {"header": e["header"], "content": e["content"]}
+        for e in page_events
+        if e["event"] == "table"
+    ]
+    for table in summary["table"]:
+        assert table in sent_tables
+        sent_tables.remove(table)
+
+    del summary["event"], summary["pages"], summary["format"]
+    assert summary == server.run(pdf)
+
+
+def test_stream_events_cover_summary(client, sample_pdf):
+    events = stream_events(client, sample_pdf)
+
+    assert events[0] == {
+        "event": "normal",
+        "key": "BOOKING_NO",
+        "value": "BK0123",
+        "page": 1,
+    }
+    assert events[-1]["pages"] == 3
+    # "OCT" looks like a common footer until page 3 is read, page 1 is then parsed again
+    assert {"event": "normal", "key": "ETD", "value": "12 OCT", "page": 1} in events
+    assert_events_cover_summary(events, sample_pdf)
+
+
+def test_stream_sends_words_uncovered_by_later_pages(client):
+    # Pages 1 and 2 share their first line, so it looks like header until page 3
+    pdf = make_pdf(
+        [
+            booking_page([("Booking No", "BK12345"), ("Remark", "fragile")]),
+            booking_page([("Booking No", "BK12345"), ("Vessel", "SEA STAR")]),
+            booking_page([("Date", "1 OCT")]),
+        ]
+    )
+    events = stream_events(client, pdf)
+
+    page_one = [(e["key"], e["value"]) for e in events if e.get("page") == 1]
+    assert sorted(page_one) == [("BOOKING_NO", "BK12345"), ("REMARK", "fragile")]
+    assert_events_cover_summary(events, pdf)
@@ -0,0 +1,83 @@
+import io
+import os
+import zipfile
+
+import numpy as np
+import pdfplumber
+import pytest
+
+from utils import snapshot_utils
+
+
+def extract(pdf):
+    with pdfplumber.open(io.BytesIO(pdf)) as doc:
+        return [page.extract_words(use_text_flow=True) for page in doc.pages]
+
+
+def test_roundtrip_extracted_words(tmp_path, sample_pdf):
+    page_words = extract(sample_pdf)
+    path = str(tmp_path / "doc.npz")
+
+    snapshot_utils.save_page_words(path, page_words, source="sample.pdf")
+
+    assert snapshot_utils.load_page_words(path) == (page_words, "sample.pdf")
+
+
+def test_roundtrip_empty_pages(tmp_path, sample_pdf):
+    page_words = extract(sample_pdf)
+    path = str(tmp_path / "doc.npz")
+
+    for pages in [[], [[]], [[], page_words[0], []]]:
+        snapshot_utils.save_page_words(path, pages)
+        assert snapshot_utils.load_page_words(path) == (pages, "")
+
+
+def test_roundtrip_without_direction(tmp_path, sample_pdf):
+    # Older pdfplumber versions do not report `direction`
+    page_words = [
+        [dict((k, v) for k, v in word.items() if k != "direction") for word in page]
+        for page in extract(sample_pdf)
+    ]
+    path = str(tmp_path / "doc.npz")
+
+    snapshot_utils.save_page_words(path, page_words)
+
+    assert snapshot_utils.load_page_words(path)[0] == page_words
+
+
+@pytest.mark.parametrize(
+    "damage",
+    [
+        lambda data: data[: len(data) // 2],  # truncated
+        lambda data: b"\0" * len(data),  # overwritten
+        lambda data: b"",  # empty
+    ],
+)
+def test_load_rejects_damaged_file(tmp_path, sample_pdf, damage):
+    path = str(tmp_path / "doc.npz")
+    snapshot_utils.save_page_words(path, extract(sample_pdf))
+
+    with open(path, "rb") as f:
+        data = f.read()
+    with open(path, "wb") as f:
+        f.write(damage(data))
+
+    with pytest.raises((ValueError, OSError, EOFError, zipfile.BadZipFile)):
+        snapshot_utils.load_page_words(path)
+
+
+def test_failed_write_leaves_no_temp_file(tmp_path, sample_pdf, monkeypatch):
+    page_words = extract(sample_pdf)
+    path = str(tmp_path / "doc.npz")
+    snapshot_utils.save_page_words(path, page_words, source="old.pdf")
+
+    def fail(*args, **kwargs):
+        raise OSError("No space left on device")
+
+    monkeypatch.setattr(np, "savez_compressed", fail)
+    with pytest.raises(OSError):
+        snapshot_utils.save_page_words(path, page_words[:1], source="new.pdf")
+
+    # The previous snapshot is untouched and no temp file is left behind
+    assert os.listdir(tmp_path) == ["doc.npz"]
+    assert snapshot_utils.load_page_words(path) == (page_words, "old.pdf")
@@ -0,0 +1,337 @@
+import gzip
+import json
+import zlib
+from typing import List, Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, gzip is always available
+    zstandard = None
+
+# Decompress in steps of this size, so a zip bomb is caught early
+DECOMPRESS_CHUNK_SIZE = 64 * 1024
+
+# Compressed bytes fed to the zstd decompressor per call, see `_ZstdDecoder`
+ZSTD_INPUT_STEP = 64
+
+
+class BodyTooLarge(Exception):
+    pass
+
+
+class _LimitedWriter:
+    # Collects decompressed bytes, raising as soon as `max_size` is passed
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.buffer = bytearray()
+
+    def write(self, data: bytes) -> int:
+        if len(self.buffer) + len(data) > self.max_size:
+            raise BodyTooLarge()
+        self.buffer += data
+        return len(data)
+
+
+class _GzipDecoder:
+    # Concatenated gzip members are decoded one after the other (RFC 1952)
+    def __init__(self, writer: _LimitedWriter):
+        self.writer = writer
+        self._decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        self._members = 0
+        self._in_member = False
+
+    def write(self, chunk: bytes) -> None:
+        data = chunk
+        while data:
+            self._in_member = True
+            self.writer.write(self._decompressor.decompress(data, DECOMPRESS_CHUNK_SIZE))
+
+            if self._decompressor.eof:
+                # Member complete, the rest of the data starts the next one
+                data = self._decompressor.unused_data
+                self._decompressor = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+                self._members += 1
+                self._in_member = False
+            else:
+                data = self._decompressor.unconsumed_tail
+
+    def finish(self) -> None:
+        self.writer.write(self._decompressor.flush())
+        if self._in_member or self._members == 0:
+            raise zlib.error("truncated gzip body")
+
+
+class _ZstdDecoder:
+    # Concatenated zstd frames are decoded one after the other (RFC 8878)
+    def __init__(self, writer: _LimitedWriter):
+        self.writer = writer
+        self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+        self._frames = 0
+        self._in_frame = False
+
+    def write(self, chunk: bytes) -> None:
+        # zstd has no output limit per call, small input steps keep the output
+        # of one call small (at most a few MB, even for RLE blocks)
+        for i in range(0, len(chunk), ZSTD_INPUT_STEP):
+            data = chunk[i : i + ZSTD_INPUT_STEP]
+            while data:
+                self._in_frame = True
+                self.writer.write(self._decompressor.decompress(data))
+
+                if not self._decompressor.eof:
+                    break
+
+                # Frame complete, the rest of the data starts the next one
+                data = self._decompressor.unused_data
+                self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+                self._frames += 1
+                self._in_frame = False
+
+    def finish(self) -> None:
+        if self._in_frame or self._frames == 0:
+            raise zstandard.ZstdError("truncated zstd body")
+
+
+DECODERS = {"gzip": _GzipDecoder}
+if zstandard is not None:
+    DECODERS["zstd"] = _ZstdDecoder
+
+
+def supported_encodings() -> List[str]:
+    """
+    Returns:
+        List[str]: Content encodings this process can read and write, preferred first.
+    """
+    return ["zstd", "gzip"] if zstandard is not None else ["gzip"]
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    """
+    Compress a whole body.
+
+    Args:
+        data: Bytes to compress.
+        encoding: "gzip" or "zstd".
+
+    Returns:
+        bytes: Compressed bytes.
+    """
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data)
+
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the response encoding from an `Accept-Encoding` header.
+
+    Args:
+        accept_encoding: Header value, e.g. "gzip, deflate, zstd;q=0.5".
+
+    Returns:
+        Optional[str]: "zstd", "gzip" or None to send the body as is.
+    """
+    accepted = set()
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        if params.replace(" ", "") in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(name.strip().lower())
+
+    for encoding in supported_encodings():
+        if encoding in accepted or "*" in accepted:
+            return encoding
+    return None
+
+
+class _StreamCompressor:
+    # Compress a streamed body chunk by chunk, flushing so every chunk is readable
+    def __init__(self, encoding: str):
+        if encoding == "zstd":
+            self._compressor = zstandard.ZstdCompressor().compressobj()
+            self._flush_mode = zstandard.COMPRESSOBJ_FLUSH_BLOCK
+        else:
+            self._compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+            self._flush_mode = zlib.Z_SYNC_FLUSH
+
+    def compress(self, data: bytes, last: bool) -> bytes:
+        compressed = self._compressor.compress(data)
+        if last:
+            return compressed + self._compressor.flush()
+        return compressed + self._compressor.flush(self._flush_mode)
+
+
+class CompressionMiddleware:
+    """
+    ASGI middleware for compressed transport.
+
+    Request bodies sent with `Content-Encoding: gzip` or `zstd` are
+    decompressed as they arrive, and rejected with 413 once they pass
+    `max_body_size` decompressed bytes. Responses are compressed
+    following `Accept-Encoding` (streamed responses chunk by chunk).
+
+    Bytes saved are reported in the `X-Request-Bytes-Saved` and
+    `X-Response-Bytes-Saved` headers (the latter for non-streamed responses).
+
+    Args:
+        app: ASGI application.
+        max_body_size: Max decompressed request body size in bytes.
+        minimum_size: Responses smaller than this are sent as is.
+    """
+
+    def __init__(self, app, max_body_size: int = 50 * 1024 * 1024, minimum_size: int = 1024):
+        self.app = app
+        self.max_body_size = max_body_size
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        extra_headers = {}
+
+        content_encoding = request_headers.get("content-encoding", "identity").lower()
+        if content_encoding != "identity":
+            if content_encoding not in DECODERS:
+                await self._error(
+                    send, 415, f"Unsupported Content-Encoding: {content_encoding}"
+                )
+                return
+
+            try:
+                body, compressed_size = await self._read_body(
+                    receive, DECODERS[content_encoding]
+                )
+            except BodyTooLarge:
+                await self._error(
+                    send, 413, f"Decompressed body is larger than {self.max_body_size} bytes"
+                )
+                return
+            except Exception:
+                await self._error(send, 400, f"Invalid {content_encoding} body")
+                return
+
+            extra_headers["x-request-bytes-saved"] = str(len(body) - compressed_size)
+            scope, receive = self._replace_body(scope, receive, body)
+
+        encoding = choose_encoding(request_headers.get("accept-encoding", ""))
+        await self.app(scope, receive, self._wrap_send(send, encoding, extra_headers))
+
+    async def _read_body(self, receive, decoder_class):
+        writer = _LimitedWriter(self.max_body_size)
+        decoder = decoder_class(writer)
+        compressed_size = 0
+
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message["type"] == "http.disconnect":
+                break
+            chunk = message.get("body", b"")
+            compressed_size += len(chunk)
+            decoder.write(chunk)
+            more_body = message.get("more_body", False)
+
+        decoder.finish()
+        return bytes(writer.buffer), compressed_size
+
+    def _replace_body(self, scope, receive, body):
+        # The app sees a plain body, later receive() calls go to the client again
+        headers = MutableHeaders(scope=scope)
+        del headers["content-encoding"]
+        headers["content-length"] = str(len(body))
+
+        body_sent = False
+
+        async def receive_body():
+            nonlocal body_sent
+            if not body_sent:
+                body_sent = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            return await receive()
+
+        return scope, receive_body
+
+    def _wrap_send(self, send, encoding, extra_headers):
+        start_message = None
+        stream_compressor = None
+
+        async def send_compressed(message):
+            nonlocal start_message, stream_compressor
+
+            if message["type"] == "http.response.start":
+                # Hold the headers until the first body chunk shows the body size
+                start_message = message
+                return
+
+            if message["type"] != "http.response.body":
+                await send(message)
+                return
+
+            body = message.get("body", b"")
+            more_body = message.get("more_body", False)
+
+            if stream_compressor is not None:
+                # Next chunk of a compressed stream
+                await send(
+                    {**message, "body": stream_compressor.compress(body, last=not more_body)}
+                )
+                return
+
+            if start_message is None:
+                # Next chunk of a response sent as is
+                await send(message)
+                return
+
+            headers = MutableHeaders(scope=start_message)
+            for k, v in extra_headers.items():
+                headers[k] = v
+
+            if (
+                encoding is None
+                or "content-encoding" in headers
+                or (not more_body and len(body) < self.minimum_size)
+            ):
+                # Send the response as is
+                await send(start_message)
+                await send(message)
+            elif not more_body:
+                # Whole body in one message
+                compressed = compress(body, encoding)
+                headers["content-encoding"] = encoding
+                headers["content-length"] = str(len(compressed))
+                headers["x-response-bytes-saved"] = str(len(body) - len(compressed))
+                headers.add_vary_header("Accept-Encoding")
+                await send(start_message)
+                await send({**message, "body": compressed})
+            else:
+                # Streamed body, size is not known in advance
+                stream_compressor = _StreamCompressor(encoding)
+                headers["content-encoding"] = encoding
+                del headers["content-length"]
+                headers.add_vary_header("Accept-Encoding")
+                await send(start_message)
+                await send({**message, "body": stream_compressor.compress(body, last=False)})
+
+            start_message = None
+
+        return send_compressed
+
+    async def _error(self, send, status_code, detail):
+        # Same body as FastAPI's HTTPException
+        body = json.dumps({"detail": detail}).encode("utf-8")
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status_code,
+                "headers": [
+                    (b"content-type", b"application/json"),
+                    (b"content-length", str(len(body)).encode("latin-1")),
+                ],
+            }
+        )
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,72 @@
+import threading
+import time
+from typing import Optional
+
+
+class DeadlineExceeded(Exception):
+    """
+    Raised by `Deadline.check()` when the deadline has passed
+    or the work has been cancelled.
+
+    Attributes:
+        stage: Name of the pipeline stage that was about to run.
+        cancelled: True if stopped by `Deadline.cancel()` (e.g. client disconnect).
+    """
+
+    def __init__(self, stage: str, cancelled: bool = False):
+        self.stage = stage
+        self.cancelled = cancelled
+        reason = "cancelled" if cancelled else "deadline exceeded"
+        super().__init__(f"{reason} before stage '{stage}'")
+
+
+class Deadline:
+    """
+    Per-request time budget shared between the request handler
+    and the parsing pipeline.
+
+    The pipeline calls `check()` between pages and between stages,
+    the request handler may call `cancel()` from another thread
+    (e.g. when the client disconnects).
+
+    Args:
+        timeout: Seconds from now until the deadline, None for no deadline.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        self.expires_at = None if timeout is None else time.monotonic() + timeout
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        """
+        Returns:
+            Optional[float]: Seconds left (never negative), None if no deadline.
+        """
+        if self.expires_at is None:
+            return None
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.cancelled or self.remaining() == 0.0
+
+    def check(self, stage: str) -> None:
+        """
+        Stop the pipeline if there is no time left.
+
+        Args:
+            stage: Name of the stage about to run (reported in the exception).
+
+        Raises:
+            DeadlineExceeded: If cancelled or the deadline has passed.
+        """
+        if self.cancelled:
+            raise DeadlineExceeded(stage, cancelled=True)
+        if self.remaining() == 0.0:
+            raise DeadlineExceeded(stage)
@@ -0,0 +1,138 @@
+import bisect
+import hashlib
+import threading
+from typing import Dict, List
+
+
+def hash_key(data: bytes) -> int:
+    """
+    Stable 64-bit position on the hash ring.
+
+    Args:
+        data: Bytes to hash (e.g. the uploaded PDF).
+
+    Returns:
+        int: Position on the ring.
+    """
+    return int.from_bytes(hashlib.sha256(data).digest()[:8], "big")
+
+
+class HashRing:
+    """
+    Consistent hash ring, so the same PDF always goes to the same node
+    and removing a node only moves the keys that node owned.
+
+    Args:
+        nodes: Node names (backend URLs).
+        replicas: Virtual nodes per node, more gives a more even spread.
+    """
+
+    def __init__(self, nodes: List[str], replicas: int = 100):
+        self.nodes = list(nodes)
+        self._ring = sorted(
+            (hash_key(f"{node}#{i}".encode("utf-8")), node)
+            for node in self.nodes
+            for i in range(replicas)
+        )
+        self._positions = [position for position, _ in self._ring]
+
+    def nodes_for(self, data: bytes) -> List[str]:
+        """
+        All nodes in ring order, starting from the owner of `data`.
+        The first node is the preferred one, the others are fallbacks.
+
+        Args:
+            data: Bytes to route (e.g. the uploaded PDF).
+
+        Returns:
+            List[str]: Every node once, preferred first.
+        """
+        if len(self._ring) == 0:
+            return []
+
+        start = bisect.bisect(self._positions, hash_key(data))
+
+        ordered_nodes = []
+        for i in range(len(self._ring)):
+            _, node = self._ring[(start + i) % len(self._ring)]
+            if node not in ordered_nodes:
+                ordered_nodes.append(node)
+                if len(ordered_nodes) == len(self.nodes):
+                    break
+
+        return ordered_nodes
+
+
+class Backend:
+    """
+    Health and load of one parser instance, as seen by the dispatcher.
+
+    Args:
+        url: Base URL of the instance (e.g. "http://127.0.0.1:8001").
+    """
+
+    def __init__(self, url: str):
+        self.url = url.rstrip("/")
+        self.healthy = True
+        # Requests the dispatcher has sent and not finished yet
+        self.in_flight = 0
+        # Requests the instance itself reported on its last health check
+        self.reported_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def queue_depth(self) -> int:
+        return max(self.in_flight, self.reported_in_flight)
+
+    def acquire(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+    def to_dict(self) -> Dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "in_flight": self.in_flight,
+            "reported_in_flight": self.reported_in_flight,
+        }
+
+
+def choose_backends(
+    ring: HashRing,
+    backends: Dict[str, Backend],
+    data: bytes,
+    max_queue_depth: int = 4,
+) -> List[Backend]:
+    """
+    Order the backends to try for one upload.
+
+    The ring owner comes first unless it is down or its queue is deeper
+    than `max_queue_depth`, then the next nodes on the ring with room,
+    then the overloaded ones (shallowest queue first), and the unhealthy
+    ones last in case the health check is out of date.
+
+    Args:
+        ring: Hash ring over the backend URLs.
+        backends: Backend state keyed by URL.
+        data: Bytes to route (e.g. the uploaded PDF).
+        max_queue_depth: A node with a deeper queue than this is skipped.
+
+    Returns:
+        List[Backend]: Backends in the order they should be tried.
+    """
+    ring_order = [backends[url] for url in ring.nodes_for(data)]
+
+    with_room = [
+        b for b in ring_order if b.healthy and b.queue_depth <= max_queue_depth
+    ]
+    overloaded = sorted(
+        (b for b in ring_order if b.healthy and b.queue_depth > max_queue_depth),
+        key=lambda b: b.queue_depth,
+    )
+    unhealthy = [b for b in ring_order if not b.healthy]
+
+    return with_room + overloaded + unhealthy
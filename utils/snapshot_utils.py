@@ -0,0 +1,105 @@
+import hashlib
+import os
+import tempfile
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+# Word attributes from `pdfplumber.Page.extract_words()`, stored one column each
+FLOAT_COLUMNS = ["x0", "x1", "top", "doctop", "bottom", "height", "width"]
+BOOL_COLUMNS = ["upright"]
+STR_COLUMNS = ["text", "direction"]
+
+
+def pdf_hash(pdf_raw: bytes) -> str:
+    """
+    Key of a document's snapshot.
+
+    Args:
+        pdf_raw: PDF bytes.
+
+    Returns:
+        str: SHA-256 hex digest of the PDF bytes.
+    """
+    return hashlib.sha256(pdf_raw).hexdigest()
+
+
+def snapshot_path(snapshot_dir: str, pdf_hash: str) -> str:
+    return os.path.join(snapshot_dir, f"{pdf_hash}.npz")
+
+
+def save_page_words(
+    path: str, page_words: List[List[Dict[str, Any]]], source: str = ""
+) -> None:
+    """
+    Store extracted words as one compressed column per attribute,
+    with `page_offsets` marking where each page starts.
+
+    Args:
+        path: Output `.npz` file.
+        page_words (List[List[Dict[str, Any]]]):
+            Pages extracted with `pdfplumber.Page.extract_words()`.
+        source: Original filename, kept for naming outputs on re-runs.
+    """
+    words = [word for page in page_words for word in page]
+    columns = dict()
+
+    for key in FLOAT_COLUMNS:
+        columns[key] = np.array([w[key] for w in words], dtype=np.float64)
+    for key in BOOL_COLUMNS:
+        columns[key] = np.array([w[key] for w in words], dtype=bool)
+    for key in STR_COLUMNS:
+        # `direction` is missing in older pdfplumber versions
+        if all(key in w for w in words):
+            columns[key] = np.array([str(w[key]) for w in words], dtype=str)
+
+    page_offsets = np.cumsum([0] + [len(page) for page in page_words], dtype=np.int64)
+
+    snapshot_dir = os.path.dirname(path) or "."
+    os.makedirs(snapshot_dir, exist_ok=True)
+
+    # Write to a unique temp file first, so a crash or a concurrent
+    # writer of the same document never leaves a broken snapshot
+    fd, temp_path = tempfile.mkstemp(dir=snapshot_dir, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez_compressed(
+                f, page_offsets=page_offsets, source=np.array(source), **columns
+            )
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def load_page_words(path: str) -> Tuple[List[List[Dict[str, Any]]], str]:
+    """
+    Load words stored by `save_page_words`.
+
+    Args:
+        path: Snapshot `.npz` file.
+
+    Returns:
+        tuple:
+            - page_words: Pages in `pdfplumber.Page.extract_words()` format.
+            - source: Original filename.
+    """
+    with np.load(path, allow_pickle=False) as snapshot:
+        page_offsets = snapshot["page_offsets"].tolist()
+        source = str(snapshot["source"])
+        columns = dict(
+            (key, snapshot[key].tolist())
+            for key in FLOAT_COLUMNS + BOOL_COLUMNS + STR_COLUMNS
+            if key in snapshot.files
+        )
+
+    words = [
+        dict((key, values[i]) for key, values in columns.items())
+        for i in range(page_offsets[-1])
+    ]
+    page_words = [
+        words[start:end] for start, end in zip(page_offsets[:-1], page_offsets[1:])
+    ]
+
+    return page_words, source